@@ -5,13 +5,29 @@ from multiprocessing import Process
 
 from results import *
 
-
-def find_in_entry(entry: str, pattern: str, can_fail: bool = False) -> str:
-    match = re.search(pattern, entry)
+# Compiled once at import time - the patterns run once per parsed entry.
+TARGET_PATTERN = re.compile(r'Faulting Target: (.+?)\.')
+ORIGINAL_IP_PATTERN = re.compile(r'Original IP\s*?:\s*?0x([a-f0-9]+?)\s')
+UPDATED_IP_PATTERN = re.compile(r'Updated IP\s*?:\s*?0x([a-f0-9]+?)\s')
+ORIGINAL_INSTRUCTION_PATTERN = re.compile(r'Original instruction\s*?:\s*?(([a-f0-9]{2} ){2,4})\s')
+UPDATED_INSTRUCTION_PATTERN = re.compile(r'Updated instruction\s*?:\s*?(([a-f0-9]{2} ){2,4})\s')
+REGISTER_NUMBER_PATTERN = re.compile(r'Reg#: (.+?)\.')
+ORIGINAL_REGISTER_PATTERN = re.compile(r'Original register\s*?:\s*?0x([a-f0-9]+?)\s')
+UPDATED_REGISTER_PATTERN = re.compile(r'Updated\s*?:\s*?0x([a-f0-9]+?)\s')
+ADDRESS_PATTERN = re.compile(r'Address: 0x([a-f0-9]+?)\.')
+HIT_PATTERN = re.compile(r'Hit: (\d+).')
+INSTRUCTION_PATTERN = re.compile(r'Instruction: (\d+).')
+ERRORED_PATTERN = re.compile(r'(Errored:)')
+ERRORED_RUN_RESULT_PATTERN = re.compile(r'(Run result: fault errored program)')
+OUTPUT_PATTERN = re.compile(r'Output.+?: ([a-f0-9]+?)\s')
+
+
+def find_in_entry(entry: str, pattern: re.Pattern[str], can_fail: bool = False) -> str:
+    match = pattern.search(entry)
     if not match:
         if can_fail:
             return ""
-        raise ValueError(f"Invalid entry, no match for pattern '{pattern}': {entry}")
+        raise ValueError(f"Invalid entry, no match for pattern '{pattern.pattern}': {entry}")
     return match.group(1)
 
 
@@ -27,24 +43,24 @@ def process_output(file_path: str, output_path: str) -> None:
             continue
         # Look for the fields Faulting Target: and Operation:,
         # based on that, extract the relevant fields.
-        target_str = find_in_entry(entry, r'Faulting Target: (.+?)\.')
+        target_str = find_in_entry(entry, TARGET_PATTERN)
 
         if target_str == "InstructionPointer":
             fault_type = FaultType.SKIP
             target = FaultTarget.PC
-            old_value = find_in_entry(entry, r'Original IP\s*?:\s*?0x([a-f0-9]+?)\s')
-            new_value = find_in_entry(entry, r'Updated IP\s*?:\s*?0x([a-f0-9]+?)\s')
+            old_value = find_in_entry(entry, ORIGINAL_IP_PATTERN)
+            new_value = find_in_entry(entry, UPDATED_IP_PATTERN)
         elif target_str == "Instruction":
             fault_type = FaultType.FLIP
             target = FaultTarget.IR
-            old_value = find_in_entry(entry, r'Original instruction\s*?:\s*?(([a-f0-9]{2} ){2,4})\s')
-            new_value = find_in_entry(entry, r'Updated instruction\s*?:\s*?(([a-f0-9]{2} ){2,4})\s')
+            old_value = find_in_entry(entry, ORIGINAL_INSTRUCTION_PATTERN)
+            new_value = find_in_entry(entry, UPDATED_INSTRUCTION_PATTERN)
         elif target_str == "Register":
             fault_type = FaultType.ZERO
-            register_number = find_in_entry(entry, r'Reg#: (.+?)\.')
+            register_number = find_in_entry(entry, REGISTER_NUMBER_PATTERN)
             target = eval(f"FaultTarget.{register_number}")
-            old_value = find_in_entry(entry, r'Original register\s*?:\s*?0x([a-f0-9]+?)\s')
-            new_value = find_in_entry(entry, r'Updated\s*?:\s*?0x([a-f0-9]+?)\s')
+            old_value = find_in_entry(entry, ORIGINAL_REGISTER_PATTERN)
+            new_value = find_in_entry(entry, UPDATED_REGISTER_PATTERN)
         else:
             raise ValueError(f"Invalid entry, unknown target: {target_str}")
         old_value = bytes.fromhex(f"{old_value.replace(' ', ''):0>8}")
@@ -56,16 +72,16 @@ def process_output(file_path: str, output_path: str) -> None:
             new_value=new_value
         )
 
-        address = find_in_entry(entry, r'Address: 0x([a-f0-9]+?)\.')
-        hit = find_in_entry(entry, r'Hit: (\d+).')
-        instruction = find_in_entry(entry, r'Instruction: (\d+).')
+        address = find_in_entry(entry, ADDRESS_PATTERN)
+        hit = find_in_entry(entry, HIT_PATTERN)
+        instruction = find_in_entry(entry, INSTRUCTION_PATTERN)
 
-        # errored = find_in_entry(entry, r'(Errored:)', can_fail=True) != ""
-        errored = find_in_entry(entry, r'(Errored:)', can_fail=True) != "" or \
-            find_in_entry(entry, r'(Run result: fault errored program)', can_fail=True) != ""
+        # errored = find_in_entry(entry, ERRORED_PATTERN, can_fail=True) != ""
+        errored = find_in_entry(entry, ERRORED_PATTERN, can_fail=True) != "" or \
+            find_in_entry(entry, ERRORED_RUN_RESULT_PATTERN, can_fail=True) != ""
 
         # If the execution errored there might be no output
-        output_str = find_in_entry(entry, r'Output.+?: ([a-f0-9]+?)\s', can_fail=True)
+        output_str = find_in_entry(entry, OUTPUT_PATTERN, can_fail=True)
         if output_str:
             output = bytes.fromhex(output_str.strip())
         else:
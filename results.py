@@ -1,3 +1,4 @@
+from dataclasses import dataclass
 from enum import Enum
 
 NO_OUTPUT = b"nooutput" * 4  # 32 bytes placeholder representing no output
@@ -28,19 +29,13 @@ class FaultTarget(Enum):
     IR = 20
 
 
+@dataclass(slots=True, frozen=True)
 class Fault:
     fault_type: FaultType
     target: FaultTarget  # the faulted register, IP for instruction skips, PC for instruction bit flips
     old_value: bytes  # The old value of the faulted register
     new_value: bytes  # The new value of the faulted register
 
-    def __init__(self, fault_type: FaultType, target: FaultTarget, old_value: bytes, new_value: bytes):
-        self.fault_type = fault_type
-        self.target = target
-        self.old_value = old_value
-        self.new_value = new_value
-
-
     def __str__(self) -> str:
         def format_instruction(instruction: bytes) -> str:
             instruction_hex = instruction.hex()
@@ -84,16 +79,12 @@ class Fault:
         return Fault(fault_type, target, old_value, new_value)
 
 
+@dataclass(slots=True, frozen=True)
 class ExecutedInstruction:
     instruction: int
     address: bytes
     hit: int
 
-    def __init__(self, instruction: int, address: bytes, hit: int):
-        self.instruction = instruction
-        self.address = address
-        self.hit = hit
-
     def to_bytes(self) -> bytes:
         if len(self.address) > 4 or self.hit > 2**32 or self.instruction > 2**32:
             raise ValueError("One of the fields is too long for the expected size.")
@@ -113,18 +104,13 @@ class ExecutedInstruction:
         return ExecutedInstruction(instruction, address, hit)
 
 
+@dataclass(slots=True, frozen=True)
 class SimulationResult:
     executed_instruction: ExecutedInstruction
     fault: Fault
     errored: bool
     output: bytes | None
 
-    def __init__(self, executed_instruction: ExecutedInstruction, fault: Fault, errored: bool, output: bytes | None):
-        self.executed_instruction = executed_instruction
-        self.fault = fault
-        self.errored = errored
-        self.output = output
-
     def to_bytes(self) -> bytes:
         # If there was no output we save the special value NO_OUTPUT
         # so that the record is still 64 bytes long.
@@ -1,11 +1,12 @@
 import argparse
 import json
 import os
-from itertools import combinations
+import sqlite3
+from multiprocessing import Pool
 from typing import Iterable
 
-from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import x25519
+import numpy as np
+from nacl.bindings import crypto_scalarmult_base
 from pyecsca.ec.context import DefaultContext, Node, ResultAction, local
 from pyecsca.ec.formula import LadderFormula, ScalingFormula
 from pyecsca.ec.mult import LadderMultiplier
@@ -17,45 +18,43 @@ EXECUTABLE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 def swap_endian(key: bytes) -> bytes:
-    # Swap the endianness of the key
-    swapped_key = int.from_bytes(key, byteorder='big')
-    swapped_key = swapped_key.to_bytes(32, byteorder='little')
-    return swapped_key
+    # Swap the endianness of the key - just the byte string reversed
+    return key[::-1]
 
 
 def clamp(key: bytes) -> bytes:
-    key_int = int.from_bytes(key, byteorder='little')
-    key_int &= ~(1 << 255)  # highest bit is 0
-    key_int |= (1 << 254)  # second highest bit is 1
-    key_int &= ~7  # lowest three bits are 0
-    return key_int.to_bytes(32, 'little')
+    # The key is little-endian, so the clamp touches only the first and last byte.
+    clamped_key = bytearray(key)
+    clamped_key[0] &= 0xF8  # lowest three bits are 0
+    clamped_key[31] &= 0x7F  # highest bit is 0
+    clamped_key[31] |= 0x40  # second highest bit is 1
+    return bytes(clamped_key)
 
 
 def get_public_key_bytes_from_private_bytes(private_bytes: bytes) -> bytes:
-    private_key = x25519.X25519PrivateKey.from_private_bytes(private_bytes)
-    public_key = private_key.public_key()
-    public_key_bytes = public_key.public_bytes(
-        encoding=serialization.Encoding.Raw,
-        format=serialization.PublicFormat.Raw)
-    return public_key_bytes
+    # libsodium clamps the scalar internally, just like X25519PrivateKey,
+    # but skips the key-object construction and serialization roundtrip.
+    return crypto_scalarmult_base(private_bytes)
 
 
 def parse_output(output_dir: str) -> Iterable[SimulationResult]:
     for filename in os.listdir(output_dir):
         if filename.endswith(".bin"):
             with open(os.path.join(output_dir, filename), "rb") as output_file:
-                # Read 64 byte chunks, for each call SimulationResult.from_bytes()
-               while chunk := output_file.read(64):
-                    result = SimulationResult.from_bytes(chunk)
+                # Read blocks of records and slice out the 64 byte chunks,
+                # for each call SimulationResult.from_bytes()
+                while block := output_file.read(64 * 4096):
+                    for offset in range(0, len(block), 64):
+                        result = SimulationResult.from_bytes(block[offset:offset + 64])
 
-                    # TODO: Decide on how exactly to handle errors.
-                    # It is possible that we do not want to see them when evaluating predictable outputs,
-                    # but do want to see them when evaluating safe error.
-                    if result.errored or result.output == NO_OUTPUT:
-                       # There was no output, we skip the result
-                       continue
+                        # TODO: Decide on how exactly to handle errors.
+                        # It is possible that we do not want to see them when evaluating predictable outputs,
+                        # but do want to see them when evaluating safe error.
+                        if result.errored or result.output == NO_OUTPUT:
+                            # There was no output, we skip the result
+                            continue
 
-                    yield result    
+                        yield result
 
 
 def parse_known_outputs(known_outputs_path: str) -> dict[bytes, int]:
@@ -123,34 +122,44 @@ def generate_faulted_keys(original_key: bytes) -> Iterable[tuple[bytes, int]]:
     Returns tuples of (faulted_key, entropy), where the entropy
     represents how many bits were used from the original key.
     """
-    # Set because we only care about unique masks.
-    fault_masks: set[bytes] = set()
+    key_int = int.from_bytes(original_key, byteorder='little')
+
+    # The masks are applied as ints (little-endian interpretation) so that
+    # each one is a single bignum AND instead of a per-byte Python loop.
+    # The families below overlap a little, but the consumer deduplicates the
+    # clamped keys anyway, so nothing is accumulated for uniqueness here.
     # Keep every of the 1, 4, 8 and 16 bytes blocks.
     for block in [8, 32, 64, 128]:
         unshifted_mask: int = 2**block - 1
-        fault_masks.update((unshifted_mask << (i * block)).to_bytes(32, 'little') for i in range(256 // block))
-
-    # Any number of bits from the start + any number of bits from the end
-    for bits_from_start in range(0, 256):
-        # Leave a space of at least one faulted bit, otherwise you use the full key
-        for bits_from_end in range(0, 256 - bits_from_start):
-            if bits_from_start + bits_from_end == 0:
-                continue
-            start_of_mask = ((1 << 256) - 1) ^ (1 << 256 - bits_from_start) - 1
-            end_of_mask = (1 << bits_from_end) - 1
-            fault_masks.add((start_of_mask | end_of_mask).to_bytes(32, 'big'))
-            fault_masks.add((start_of_mask | end_of_mask).to_bytes(32, 'little'))
-
-    for mask in fault_masks:
-        num_bits = bin(int.from_bytes(mask, byteorder='little')).count('1')
-        faulted_key_bytes = bytes(a & b for a, b in zip(original_key, mask))
-        yield faulted_key_bytes, num_bits
+        for i in range(256 // block):
+            yield (key_int & (unshifted_mask << (i * block))).to_bytes(32, 'little'), block
+
+    # Any number of bits from the start + any number of bits from the end.
+    # Enumerate all (bits_from_start, bits_from_end) pairs at once as a bit tensor,
+    # pack it into 32-byte masks and apply them to the key at C level instead of
+    # shifting and masking Python bigints one pair at a time.
+    bit_positions = np.arange(256, dtype=np.int32)
+    bits_from_start = np.arange(256, dtype=np.int32)[:, None]
+    bits_from_end = np.arange(256, dtype=np.int32)[None, :]
+    mask_bits = (bit_positions[None, None, :] < bits_from_start[:, :, None]) \
+        | (bit_positions[None, None, :] >= 256 - bits_from_end[:, :, None])
+    # Leave a space of at least one faulted bit, otherwise you use the full key
+    valid = (bits_from_start + bits_from_end > 0) & (bits_from_start + bits_from_end < 256)
+    start_end_masks = np.packbits(mask_bits[valid], axis=-1)
+    # The byte-reversed masks cover the little-endian variants.
+    start_end_masks = np.concatenate((start_end_masks, start_end_masks[:, ::-1]))
+    # The kept start and end bits do not overlap, so the entropy of each mask
+    # is simply bits_from_start + bits_from_end.
+    num_kept_bits = np.tile((bits_from_start + bits_from_end)[valid], 2).tolist()
+    faulted_key_buffer = (start_end_masks & np.frombuffer(original_key, dtype=np.uint8)).tobytes()
+    for index, num_bits in enumerate(num_kept_bits):
+        yield faulted_key_buffer[index * 32:(index + 1) * 32], num_bits
 
     # The original key shifted any number of positions to either left or right,
     # the remaining bits set to either 0 or 1
     for bits_shifted in range(1, 256):
-        shifted_left_fill_0 = (int.from_bytes(original_key, byteorder='little') << bits_shifted) & ((1 << 256) - 1)
-        shifted_right_fill_0 = int.from_bytes(original_key, byteorder='little') >> bits_shifted
+        shifted_left_fill_0 = (key_int << bits_shifted) & ((1 << 256) - 1)
+        shifted_right_fill_0 = key_int >> bits_shifted
         shifted_left_fill_1 = shifted_left_fill_0 | ((1 << bits_shifted) - 1)
         shifted_right_fill_1 = shifted_right_fill_0 | (((1 << bits_shifted) - 1) << (256 - bits_shifted))
         yield from ((x.to_bytes(32, 'little'), 256 - bits_shifted) for x in (
@@ -161,48 +170,113 @@ def generate_faulted_keys(original_key: bytes) -> Iterable[tuple[bytes, int]]:
         ))
 
     for i in range(1 << 8):
-        num_bits = bin(i).count('1')
+        num_bits = i.bit_count()
         yield i.to_bytes(32, 'big'), num_bits
         yield i.to_bytes(32, 'little'), num_bits
 
-    # Only highest and lowest byte non-empty
-    for upper_num_bits in range(0, 8):
-        for upper_bits in combinations(range(8), upper_num_bits):
-            for lower_num_bits in range(0, 8):
-                for lower_bits in combinations(range(8), lower_num_bits):
-                    faulted_key = 0
-                    for bit in upper_bits:
-                        faulted_key |= 1 << bit
-                    for bit in lower_bits:
-                        faulted_key |= 1 << (bit + 248)
-                    yield faulted_key.to_bytes(32, 'little'), upper_num_bits + lower_num_bits
+    # Only highest and lowest byte non-empty.
+    # Every subset of the 8 bits of a byte is exactly one of its 256 values,
+    # so enumerating the two byte values directly covers all combinations.
+    # Up to 7 bits per byte were kept, so the value 0xff (all 8 bits) is skipped.
+    middle_bytes = bytes(30)
+    for lowest_byte in range(255):
+        lowest_part = bytes([lowest_byte]) + middle_bytes
+        lowest_num_bits = lowest_byte.bit_count()
+        for highest_byte in range(255):
+            yield lowest_part + bytes([highest_byte]), lowest_num_bits + highest_byte.bit_count()
+
+
+def open_faulted_results_cache() -> sqlite3.Connection:
+    connection = sqlite3.connect(os.path.join(EXECUTABLE_DIR, "faulted_results.db"))
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("CREATE TABLE IF NOT EXISTS faulted_results (key BLOB PRIMARY KEY, public_key BLOB)")
+    # Import any results from the legacy JSON cache, but only into an empty
+    # database - re-parsing the JSON on every open would defeat the cache.
+    legacy_path = os.path.join(EXECUTABLE_DIR, "faulted_results.json")
+    cache_is_empty = connection.execute("SELECT NOT EXISTS (SELECT 1 FROM faulted_results)").fetchone()[0]
+    if cache_is_empty and os.path.exists(legacy_path):
+        with open(legacy_path) as f:
+            legacy_results: dict[str, str] = json.loads(f.read())
+        connection.executemany(
+            "INSERT OR IGNORE INTO faulted_results VALUES (?, ?)",
+            ((bytes.fromhex(key), bytes.fromhex(public_key)) for key, public_key in legacy_results.items()))
+        connection.commit()
+    return connection
 
 
 def generate_faulted_results(original_key: bytes) -> Iterable[tuple[bytes, bytes, int]]:
-    key_result_dict: dict[str, str] = {}
-    faulted_results_path = os.path.join(EXECUTABLE_DIR, "faulted_results.json")
-    if os.path.exists(faulted_results_path):
-        with open(faulted_results_path) as f:
-            key_result_dict = json.loads(f.read())
-
+    # The whole stream is a pure function of the original key, so once it has
+    # been computed it is kept on disk as flat 66 byte
+    # (clamped_key || public_key || entropy) records and simply replayed,
+    # skipping the mask enumeration and the scalar multiplications entirely.
+    precomputed_path = os.path.join(EXECUTABLE_DIR, f"faulted_results_{original_key.hex()}.bin")
+    # A size that is not a whole number of records means the file is damaged,
+    # recompute it instead of replaying truncated values.
+    if os.path.exists(precomputed_path) and os.path.getsize(precomputed_path) % 66 == 0:
+        with open(precomputed_path, "rb") as precomputed_file:
+            while block := precomputed_file.read(66 * 4096):
+                for offset in range(0, len(block), 66):
+                    record = block[offset:offset + 66]
+                    yield record[0:32], record[32:64], int.from_bytes(record[64:66], "little")
+        return
+
+    connection = open_faulted_results_cache()
+
+    # The faulted keys overlap heavily and many of them clamp to the same
+    # value, no need to process (and potentially multiply) those again.
+    # The same key might have been generated with different entropies.
+    # We care about the smallest one.
+    unique_clamped_keys: dict[bytes, int] = {}
     for faulted_key, entropy in generate_faulted_keys(original_key):
         clamped_key = clamp(faulted_key)
-        
+
         if clamped_key == original_key:
             # Skip "faulted" keys equal to the original key for clearer output.
             continue
 
-        if clamped_key.hex() in key_result_dict:
-            resulting_public_key = bytes.fromhex(key_result_dict[clamped_key.hex()])
-        else:
-            resulting_public_key = get_public_key_bytes_from_private_bytes(clamped_key)
-            key_result_dict[clamped_key.hex()] = resulting_public_key.hex()
-
-        yield clamped_key, resulting_public_key, entropy
-
-    # Save the precomputed multiplication results so that they not need to be computed again.
-    with open(faulted_results_path, 'w') as f:
-        f.write(json.dumps(key_result_dict))
+        known_entropy = unique_clamped_keys.get(clamped_key)
+        if known_entropy is None or entropy < known_entropy:
+            unique_clamped_keys[clamped_key] = entropy
+
+    # Load the cache into memory once instead of issuing one SELECT per key.
+    resulting_public_keys: dict[bytes, bytes] = dict(
+        connection.execute("SELECT key, public_key FROM faulted_results"))
+    uncached_keys = [clamped_key for clamped_key in unique_clamped_keys
+                     if clamped_key not in resulting_public_keys]
+
+    # The scalar multiplications dominate the runtime and are independent
+    # of each other, so spread the uncached ones across all cores.
+    # Save the results so that they not need to be computed again,
+    # committing in batches so that an interrupted run keeps its progress.
+    if uncached_keys:
+        with Pool(os.cpu_count()) as pool:
+            insert_batch: list[tuple[bytes, bytes]] = []
+            for clamped_key, resulting_public_key in zip(
+                    uncached_keys,
+                    pool.imap(get_public_key_bytes_from_private_bytes, uncached_keys, chunksize=256)):
+                resulting_public_keys[clamped_key] = resulting_public_key
+                insert_batch.append((clamped_key, resulting_public_key))
+                if len(insert_batch) >= 1000:
+                    connection.executemany("INSERT OR IGNORE INTO faulted_results VALUES (?, ?)", insert_batch)
+                    connection.commit()
+                    insert_batch.clear()
+            if insert_batch:
+                connection.executemany("INSERT OR IGNORE INTO faulted_results VALUES (?, ?)", insert_batch)
+                connection.commit()
+    connection.close()
+
+    # Write the records to a temporary file and move it into place only once
+    # it is complete, so that neither an abandoned generator nor an
+    # interrupted run can leave a truncated file behind to be replayed.
+    with open(precomputed_path + ".tmp", "wb") as precomputed_file:
+        for clamped_key, entropy in unique_clamped_keys.items():
+            precomputed_file.write(
+                clamped_key + resulting_public_keys[clamped_key] + entropy.to_bytes(2, "little"))
+    os.replace(precomputed_path + ".tmp", precomputed_path)
+
+    for clamped_key, entropy in unique_clamped_keys.items():
+        yield clamped_key, resulting_public_keys[clamped_key], entropy
 
 
 def check_key_shortening(parsed_output: list[SimulationResult], key: bytes):
@@ -281,30 +355,28 @@ def check_safe_error(output_dir_1: str, output_dir_2: str, key_1: bytes, key_2:
     results_sim_2 = list(parse_output(output_dir_2))
     print(f"Number of fault results: {len(results_sim_1)}, {len(results_sim_2)}")
     print()
-    # Any value definitely larger than the total number of instructions
-    results_sim_1_ordered: list[SimulationResult | None] = [None for _ in range(1_000_000)]
-    results_sim_2_ordered: list[SimulationResult | None] = [None for _ in range(1_000_000)]
-    for result_sim_1_tmp in results_sim_1:
-        results_sim_1_ordered[result_sim_1_tmp.executed_instruction.instruction] = result_sim_1_tmp
-    for result_sim_2_tmp in results_sim_2:
-        results_sim_2_ordered[result_sim_2_tmp.executed_instruction.instruction] = result_sim_2_tmp
-    
+    # Join the two runs on the instruction number.
+    results_sim_1_by_instruction = {result.executed_instruction.instruction: result for result in results_sim_1}
+    results_sim_2_by_instruction = {result.executed_instruction.instruction: result for result in results_sim_2}
+
     correct_result_1 = get_public_key_bytes_from_private_bytes(key_1)
     correct_result_2 = get_public_key_bytes_from_private_bytes(key_2)
 
     potentially_prone_addresses: dict[bytes, set[int]] = {}
-    for result_sim_1, result_sim_2 in zip(
-            results_sim_1_ordered, results_sim_2_ordered):
-        if result_sim_1 is None or result_sim_2 is None:
+    for instruction, result_sim_1 in results_sim_1_by_instruction.items():
+        result_sim_2 = results_sim_2_by_instruction.get(instruction)
+        if result_sim_2 is None:
             continue
-        assert result_sim_1.executed_instruction.address == result_sim_2.executed_instruction.address
-        assert result_sim_1.executed_instruction.hit == result_sim_2.executed_instruction.hit
-        assert result_sim_1.executed_instruction.instruction == result_sim_2.executed_instruction.instruction
+        executed_instruction_1 = result_sim_1.executed_instruction
+        executed_instruction_2 = result_sim_2.executed_instruction
+        # One field-tuple comparison, stripped entirely under python -O.
+        assert executed_instruction_1 == executed_instruction_2
 
         if (result_sim_1.output == correct_result_1) ^ (result_sim_2.output == correct_result_2):
-            if result_sim_1.executed_instruction.address not in potentially_prone_addresses:
-                potentially_prone_addresses[result_sim_1.executed_instruction.address] = set()
-            potentially_prone_addresses[result_sim_1.executed_instruction.address].add(result_sim_1.executed_instruction.hit)
+            address = executed_instruction_1.address
+            if address not in potentially_prone_addresses:
+                potentially_prone_addresses[address] = set()
+            potentially_prone_addresses[address].add(executed_instruction_1.hit)
 
     print("Addresses potentially prone to safe error attack:")
     for address, hits in sorted(potentially_prone_addresses.items()):